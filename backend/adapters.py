@@ -0,0 +1,224 @@
+"""上游生成接口的响应适配
+
+每个服务商声明结果所在的 JSON 路径 (如 "data[0].url")，路径在导入时预编译。
+响应体以流的方式解析：超过 INLINE_STRING_LIMIT 的字符串 (通常是内联的 base64
+媒体) 直接解码写入 MediaStore，不在内存中保留，解析结果里用占位符代替。
+前端只会收到归一化后的 GenerationResult，不会收到原始响应。
+"""
+import codecs
+import json
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple, Union
+
+try:
+    from backend.media import MediaStore
+except ImportError:
+    from media import MediaStore
+
+INLINE_STRING_LIMIT = 64 * 1024
+# 被转存的字符串在解析结果中的占位前缀，后接本地 URL
+STORED_MARKER = "\x00stored:"
+
+PATH_TOKEN_RE = re.compile(r"([^.\[\]]+)|\[(\d+)\]")
+STRING_SPECIAL_RE = re.compile(r'["\\]')
+# 结果会作为链接交给前端，只接受 http(s) 地址 (本地文件由 MediaStore 返回 /media/ 路径)
+RESULT_URL_SCHEMES = ("http://", "https://")
+
+PathStep = Union[str, int]
+
+
+def compile_path(path: str) -> Tuple[PathStep, ...]:
+    """'data[0].url' -> ('data', 0, 'url')"""
+    steps = []
+    for key, index in PATH_TOKEN_RE.findall(path):
+        steps.append(int(index) if index else key)
+    return tuple(steps)
+
+
+def resolve_path(payload, steps: Tuple[PathStep, ...]):
+    value = payload
+    for step in steps:
+        if isinstance(step, int):
+            if not isinstance(value, list) or step >= len(value):
+                return None
+        elif not isinstance(value, dict):
+            return None
+        value = value[step] if isinstance(step, int) else value.get(step)
+        if value is None:
+            return None
+    return value
+
+
+class StreamingBody:
+    """逐块扫描 JSON 文本，把过长的字符串转存为文件，其余部分拼成较小的骨架。
+
+    只需找出字符串边界：字符串外的内容原样保留，字符串内只关心引号和反斜杠，
+    因此每块只用正则做一次 C 层扫描。
+    """
+
+    def __init__(self, store: MediaStore, default_ext: str, limit: int = INLINE_STRING_LIMIT):
+        self.store = store
+        self.default_ext = default_ext
+        self.limit = limit
+        self.skeleton: List[str] = []
+        self.stored: List[str] = []
+        self.in_string = False
+        self.pending_escape = False
+        self.current: List[str] = []
+        self.current_len = 0
+        self.writer = None
+
+    def _append(self, text: str):
+        if self.writer is not None:
+            self.writer.feed(self._unescape(text))
+            return
+        self.current.append(text)
+        self.current_len += len(text)
+        if self.current_len > self.limit:
+            self.writer = self.store.writer(self.default_ext)
+            self.writer.feed(self._unescape("".join(self.current)))
+            self.current = []
+
+    @staticmethod
+    def _unescape(text: str) -> str:
+        # base64 中只可能出现被转义的 "/" 和换行
+        return text.replace("\\/", "/").replace("\\n", "").replace("\\r", "")
+
+    def _end_string(self):
+        if self.writer is not None:
+            url = self.writer.close()
+            self.writer = None
+            if url:
+                self.stored.append(url)
+                # 骨架中已有开头的引号
+                self.skeleton.append(json.dumps(STORED_MARKER + url)[1:])
+            else:
+                # 无法解码的长字符串以 null 代替
+                self.skeleton[-1] = self.skeleton[-1][:-1] + "null"
+        else:
+            self.skeleton.append("".join(self.current))
+            self.skeleton.append('"')
+        self.current = []
+        self.current_len = 0
+        self.in_string = False
+
+    def feed(self, text: str):
+        pos = 0
+        size = len(text)
+        while pos < size:
+            if not self.in_string:
+                quote = text.find('"', pos)
+                if quote == -1:
+                    self.skeleton.append(text[pos:])
+                    return
+                self.skeleton.append(text[pos:quote + 1])
+                self.in_string = True
+                pos = quote + 1
+                continue
+            if self.pending_escape:
+                self._append("\\" + text[pos])
+                self.pending_escape = False
+                pos += 1
+                continue
+            match = STRING_SPECIAL_RE.search(text, pos)
+            end = match.start() if match else size
+            if end > pos:
+                self._append(text[pos:end])
+            if not match:
+                return
+            if match.group() == "\\":
+                if end + 1 < size:
+                    self._append(text[end:end + 2])
+                    pos = end + 2
+                else:
+                    self.pending_escape = True
+                    pos = size
+                continue
+            self._end_string()
+            pos = end + 1
+
+    def result(self):
+        return json.loads("".join(self.skeleton))
+
+
+def parse_streaming_json(chunks: Iterable[bytes], store: MediaStore, default_ext: str = ".bin",
+                         limit: int = INLINE_STRING_LIMIT):
+    """返回 (解析结果, 转存文件的 URL 列表)"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    body = StreamingBody(store, default_ext, limit)
+    try:
+        for chunk in chunks:
+            body.feed(decoder.decode(chunk))
+        body.feed(decoder.decode(b"", final=True))
+        return body.result(), body.stored
+    except Exception:
+        if body.writer is not None:
+            body.writer.discard()
+        for url in body.stored:
+            store.delete(url)
+        raise
+
+
+@dataclass
+class GenerationResult:
+    provider: str
+    media_type: str
+    url: str
+
+
+class ResponseAdapter:
+    def __init__(self, provider: str, media_type: str, extension: str,
+                 url_paths: Iterable[str], base64_paths: Iterable[str] = ()):
+        self.provider = provider
+        self.media_type = media_type
+        self.extension = extension
+        self.url_paths = [compile_path(p) for p in url_paths]
+        self.base64_paths = [compile_path(p) for p in base64_paths]
+
+    def _resolve(self, value, store: MediaStore, is_base64: bool) -> Optional[str]:
+        if not isinstance(value, str) or not value:
+            return None
+        if value.startswith(STORED_MARKER):
+            return value[len(STORED_MARKER):]
+        if value.startswith("data:") or is_base64:
+            return store.save_base64(value, self.extension)
+        if value.lower().startswith(RESULT_URL_SCHEMES):
+            return value
+        return None
+
+    def extract(self, payload, store: MediaStore) -> Optional[GenerationResult]:
+        for steps in self.url_paths:
+            url = self._resolve(resolve_path(payload, steps), store, False)
+            if url:
+                return GenerationResult(self.provider, self.media_type, url)
+        for steps in self.base64_paths:
+            url = self._resolve(resolve_path(payload, steps), store, True)
+            if url:
+                return GenerationResult(self.provider, self.media_type, url)
+        return None
+
+    def parse(self, chunks: Iterable[bytes], store: MediaStore) -> Optional[GenerationResult]:
+        payload, stored = parse_streaming_json(chunks, store, self.extension)
+        result = self.extract(payload, store)
+        # 删除没有被用作结果的转存文件
+        for url in stored:
+            if result is None or url != result.url:
+                store.delete(url)
+        return result
+
+
+ADAPTERS = {
+    "sora": ResponseAdapter("sora", "video", ".mp4",
+                            url_paths=["video_url", "url", "data[0].url", "data[0].video_url"],
+                            base64_paths=["data[0].b64_json", "video"]),
+    "image": ResponseAdapter("image", "image", ".png",
+                             url_paths=["image_url", "url", "data[0].url"],
+                             base64_paths=["data[0].b64_json", "image"]),
+    "suno": ResponseAdapter("suno", "audio", ".mp3",
+                            url_paths=["audio_url", "url", "data[0].url", "data[0].audio_url"],
+                            base64_paths=["data[0].b64_json", "audio"]),
+    "heygem": ResponseAdapter("heygem", "video", ".mp4",
+                              url_paths=["video_url", "url", "data[0].url", "data[0].video_url"],
+                              base64_paths=["data[0].b64_json", "video"]),
+}
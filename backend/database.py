@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, ForeignKey
+from typing import List
+from sqlalchemy import create_engine, inspect, Column, Integer, String, Float, Boolean, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 
@@ -43,12 +44,12 @@ class Transaction(Base):
     __tablename__ = "transactions"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     amount = Column(Float) # 充值金额
     credits = Column(Float) # 获得点数
-    type = Column(String) # "recharge" or "usage"
+    type = Column(String) # "recharge", "usage", "bonus", "adjustment" or "refund"
     description = Column(String, nullable=True)
-    timestamp = Column(Float) # Unix timestamp
+    timestamp = Column(Float, index=True) # Unix timestamp
 
 class PromptTemplate(Base):
     __tablename__ = "prompt_templates"
@@ -59,3 +60,43 @@ class PromptTemplate(Base):
     category = Column(String, default="general") # For grouping
     is_active = Column(Boolean, default=True)
 
+
+class JobCheckpoint(Base):
+    __tablename__ = "job_checkpoints"
+
+    name = Column(String, primary_key=True) # e.g. "reconcile"
+    value = Column(Integer, default=0) # 已处理到的最大 id
+    updated_at = Column(Float, nullable=True) # Unix timestamp
+
+class Generation(Base):
+    __tablename__ = "generations"
+    # 作品库按用户、时间倒序分页
+    __table_args__ = (Index("ix_generations_user_created", "user_id", "created_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    kind = Column(String) # "image", "video", "music", "avatar" or "canvas"
+    prompt = Column(String)
+    result_url = Column(String)
+    thumbnail_url = Column(String, nullable=True) # 后台生成，未生成时为空
+    cost = Column(Float)
+    created_at = Column(Float) # Unix timestamp
+
+
+def ensure_indexes(bind=engine) -> List[str]:
+    """create_all 不会给已存在的表补建索引 (如 transactions.user_id / timestamp)，
+    这里为缺失的索引执行 CREATE INDEX，返回新建的索引名。
+
+    大表上建索引会锁表写入，应在低峰期执行 (python -m backend.reconcile --backfill)。
+    """
+    inspector = inspect(bind)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=bind)
+                created.append(index.name)
+    return created
@@ -0,0 +1,136 @@
+"""进程生命周期：优雅停机时的在途请求追踪、退款，以及健康检查状态
+
+收到 SIGTERM 后 uvicorn 会停止接收新连接，并在 timeout_graceful_shutdown
+内等待在途请求完成；超时仍未完成的请求会被取消，已扣的积分在这里退回
+(写入 "refund" 流水)。
+"""
+import contextvars
+import itertools
+import signal
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+try:
+    from backend.database import SessionLocal, User, Transaction
+except ImportError:
+    from database import SessionLocal, User, Transaction
+
+SERVER_STATE = {
+    "started_at": time.time(),
+    "draining": False,
+}
+
+# 在途的生成请求: request id -> {"user_id", "cost", "cancelled"}
+INFLIGHT: Dict[int, dict] = {}
+INFLIGHT_LOCK = threading.Lock()
+CURRENT_REQUEST: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("current_request", default=None)
+_request_ids = itertools.count(1)
+
+# 上游接口最近一次调用结果: url -> {"ok", "error", "timestamp"}
+PROVIDER_HEALTH: Dict[str, dict] = {}
+
+
+def begin_request() -> dict:
+    entry = {"id": next(_request_ids), "user_id": None, "cost": 0.0, "cancelled": False}
+    with INFLIGHT_LOCK:
+        INFLIGHT[entry["id"]] = entry
+    CURRENT_REQUEST.set(entry)
+    return entry
+
+
+def end_request(entry: dict):
+    with INFLIGHT_LOCK:
+        INFLIGHT.pop(entry["id"], None)
+
+
+def record_charge(user_id: int, cost: float) -> bool:
+    """在扣费前登记到当前请求；请求已被取消时返回 False，调用方不应再扣费"""
+    entry = CURRENT_REQUEST.get()
+    if entry is None:
+        return True
+    with INFLIGHT_LOCK:
+        if entry["cancelled"]:
+            return False
+        entry["user_id"] = user_id
+        entry["cost"] += cost
+    return True
+
+
+def release_charge(cost: float):
+    """扣费未能提交时撤销 record_charge 的登记"""
+    entry = CURRENT_REQUEST.get()
+    if entry is None:
+        return
+    with INFLIGHT_LOCK:
+        entry["cost"] = max(0.0, entry["cost"] - cost)
+
+
+def refund(entry: dict, reason: str) -> float:
+    """取消请求并退回已扣积分，返回退款额；重复调用不会重复退款"""
+    with INFLIGHT_LOCK:
+        entry["cancelled"] = True
+        INFLIGHT.pop(entry["id"], None)
+        user_id, cost = entry["user_id"], entry["cost"]
+        entry["cost"] = 0.0
+    if not user_id or not cost:
+        return 0.0
+
+    db = SessionLocal()
+    try:
+        db.query(User).filter(User.id == user_id).update(
+            {User.balance: User.balance + cost}, synchronize_session=False
+        )
+        db.add(Transaction(user_id=user_id, amount=0, credits=cost, type="refund", description=reason, timestamp=time.time()))
+        db.commit()
+    finally:
+        db.close()
+    print(f"Refunded {cost} credits to user {user_id}: {reason}")
+    return cost
+
+
+def refund_all_inflight(reason: str) -> int:
+    with INFLIGHT_LOCK:
+        entries = list(INFLIGHT.values())
+    for entry in entries:
+        refund(entry, reason)
+    return len(entries)
+
+
+def start_draining():
+    SERVER_STATE["draining"] = True
+
+
+def install_drain_handlers():
+    """在 uvicorn 的信号处理前先标记 draining，使 /readyz 立即返回 503、新的生成请求被拒绝"""
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+
+        def handler(signum, frame, previous=previous):
+            start_draining()
+            if callable(previous):
+                previous(signum, frame)
+            elif previous == signal.SIG_DFL:
+                raise SystemExit(128 + signum)
+
+        signal.signal(sig, handler)
+
+
+def record_provider_result(url: str, ok: bool, error: Optional[str] = None):
+    PROVIDER_HEALTH[url] = {"ok": ok, "error": error, "timestamp": time.time()}
+
+
+def check_database() -> Optional[str]:
+    """返回 None 表示数据库可用，否则返回错误信息"""
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT 1"))
+        return None
+    except Exception as e:
+        return str(e)
+    finally:
+        db.close()
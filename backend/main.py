@@ -1,14 +1,19 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Optional, List, Dict
+from contextlib import asynccontextmanager
+import asyncio
 import time
 import os
+import json
 import requests
 from dotenv import load_dotenv
 from passlib.context import CryptContext
@@ -16,15 +21,30 @@ from jose import JWTError, jwt
 
 # 尝试导入数据库模块 (兼容不同的运行方式)
 try:
-    from backend.database import SessionLocal, engine, Base, User, Transaction, PromptTemplate
+    from backend.database import SessionLocal, engine, Base, User, Transaction, PromptTemplate, Generation
+    from backend.export import EXPORT_FORMATS, stream_export
+    from backend.reconcile import BaselineMissing, reconcile
+    from backend.prompt_pipeline import PromptRejected, build_default_pipeline
+    from backend import lifecycle
+    from backend.adapters import ADAPTERS, ResponseAdapter, GenerationResult
+    from backend.media import MediaStore, PERSIST_RESULTS
+    from backend.thumbnails import create_thumbnail
 except ImportError:
-    from database import SessionLocal, engine, Base, User, Transaction, PromptTemplate
+    from database import SessionLocal, engine, Base, User, Transaction, PromptTemplate, Generation
+    from export import EXPORT_FORMATS, stream_export
+    from reconcile import BaselineMissing, reconcile
+    from prompt_pipeline import PromptRejected, build_default_pipeline
+    import lifecycle
+    from adapters import ADAPTERS, ResponseAdapter, GenerationResult
+    from media import MediaStore, PERSIST_RESULTS
+    from thumbnails import create_thumbnail
 
 # 加载环境变量
 load_dotenv()
 
-# 初始化数据库表
-Base.metadata.create_all(bind=engine)
+# 初始化数据库表 (由 backend.serve 启动时已在主进程中建好)
+if os.getenv("DB_SCHEMA_READY", "false").lower() != "true":
+    Base.metadata.create_all(bind=engine)
 
 # 全局配置存储 (模拟数据库)
 APP_CONFIG = {
@@ -50,6 +70,12 @@ PRICING = {
     "avatar": 30.0
 }
 
+# 可选的高性能 JSON 编码器 (pip install orjson)，未安装时回退到标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # JWT 配置
 SECRET_KEY = "your-secret-key-keep-it-secret" # 生产环境应从 env 读取
 ALGORITHM = "HS256"
@@ -59,7 +85,15 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 300
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    lifecycle.install_drain_handlers()
+    yield
+    # uvicorn 已等待在途请求直到超时，剩余的请求退回积分
+    lifecycle.start_draining()
+    lifecycle.refund_all_inflight("Refund: server shut down before generation finished")
+
+app = FastAPI(lifespan=lifespan)
 
 # 尝试从环境变量初始化配置
 if os.getenv("SORA_API_KEY"):
@@ -67,6 +101,18 @@ if os.getenv("SORA_API_KEY"):
 if os.getenv("MOCK_MODE"):
     APP_CONFIG["mock_mode"] = os.getenv("MOCK_MODE").lower() == "true"
 
+# 上游内联返回的媒体文件
+MEDIA_STORE = MediaStore()
+
+# 提示词预处理 (屏蔽词以逗号分隔，例如 PROMPT_BLOCKLIST="foo,bar"；
+# 屏蔽正则放在 PROMPT_BLOCKLIST_PATTERNS 中，每行一条，例如 \bkill\b)
+PROMPT_PIPELINE = build_default_pipeline(
+    blocklist=os.getenv("PROMPT_BLOCKLIST", "").split(","),
+    patterns=os.getenv("PROMPT_BLOCKLIST_PATTERNS", "").splitlines(),
+    max_length=int(os.getenv("MAX_PROMPT_LENGTH", "2000")),
+    blocklist_mode=os.getenv("PROMPT_BLOCKLIST_MODE", "reject"),
+)
+
 # 配置 CORS
 app.add_middleware(
     CORSMiddleware,
@@ -76,6 +122,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 追踪在途的生成请求：停机时拒绝新请求；扣费后失败或被取消的请求退回积分
+@app.middleware("http")
+async def track_generation_requests(request: Request, call_next):
+    if not request.url.path.startswith("/api/generate-"):
+        return await call_next(request)
+    if lifecycle.SERVER_STATE["draining"]:
+        return JSONResponse(status_code=503, content={"detail": "Server is restarting, please retry shortly"}, headers={"Retry-After": "5"})
+
+    entry = lifecycle.begin_request()
+    try:
+        response = await call_next(request)
+    except asyncio.CancelledError:
+        lifecycle.refund(entry, "Refund: generation cancelled during server shutdown")
+        raise
+    except Exception:
+        await run_in_threadpool(lifecycle.refund, entry, "Refund: generation failed")
+        raise
+    finally:
+        lifecycle.end_request(entry)
+
+    # 上游报错或没有可用结果时用户没有拿到作品，退回已扣积分
+    if response.status_code >= 400:
+        await run_in_threadpool(lifecycle.refund, entry, "Refund: generation failed")
+    return response
+
 # --- 依赖项 ---
 
 def get_db():
@@ -119,6 +190,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         raise credentials_exception
     return user
 
+class FastJSONResponse(JSONResponse):
+    """直接序列化原生 dict/list，跳过 jsonable_encoder 和 response_model 校验。
+
+    仅用于只读列表接口，调用方需保证内容已是 JSON 原生类型。
+    """
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def rows_to_dicts(query):
+    """执行列元组查询，直接返回 dict 列表 (不实例化 ORM 对象)"""
+    return [dict(row._mapping) for row in query]
+
 # --- Pydantic Models ---
 
 class UserCreate(BaseModel):
@@ -159,23 +245,28 @@ class VideoRequest(BaseModel):
     prompt: str
     size: str = "1024x1024"
     duration: int = 5
+    variables: Optional[Dict[str, str]] = None # 模板占位符取值，如 {"SUBJECT": "cat"}
 
 class ImageRequest(BaseModel):
     prompt: str
     size: str = "1024x1024"
+    variables: Optional[Dict[str, str]] = None
 
 class MusicRequest(BaseModel):
     prompt: str
     duration: int = 30
+    variables: Optional[Dict[str, str]] = None
 
 class AvatarRequest(BaseModel):
     prompt: str
     text: str
+    variables: Optional[Dict[str, str]] = None
 
 class CanvasRequest(BaseModel):
     prompt: str
     init_image: Optional[str] = None
     size: str = "1024x1024"
+    variables: Optional[Dict[str, str]] = None
 
 class PricingUpdateRequest(BaseModel):
     password: str
@@ -236,6 +327,9 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
         
         new_user = User(username=user.username, hashed_password=hashed_password, email=email_to_save, balance=10.0) # 注册送10积分
         db.add(new_user)
+        db.flush()
+        # 赠送积分也记入流水，保证余额可由流水对账
+        db.add(Transaction(user_id=new_user.id, amount=0, credits=10.0, type="bonus", description="Signup bonus", timestamp=time.time()))
         db.commit()
         db.refresh(new_user)
         return new_user
@@ -283,8 +377,10 @@ async def recharge(request: RechargeRequest, current_user: User = Depends(get_cu
         timestamp=time.time()
     )
     
-    # 更新余额
-    current_user.balance += credits_amount
+    # 更新余额 (原子累加，避免覆盖并发扣费)
+    db.query(User).filter(User.id == current_user.id).update(
+        {User.balance: User.balance + credits_amount}, synchronize_session=False
+    )
     
     db.add(transaction)
     db.commit()
@@ -346,34 +442,95 @@ async def update_pricing(request: PricingUpdateRequest):
 async def get_users(password: str, db: Session = Depends(get_db)):
     if password != APP_CONFIG["admin_password"]:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    users = db.query(User).all()
-    return users
+    users = db.query(User.id, User.username, User.email, User.balance, User.is_active)
+    return FastJSONResponse(rows_to_dicts(users))
 
 @app.post("/api/admin/users/{user_id}/balance")
 async def update_user_balance(user_id: int, request: UserBalanceUpdate, db: Session = Depends(get_db)):
     if request.password != APP_CONFIG["admin_password"]:
         raise HTTPException(status_code=401, detail="Unauthorized")
     
-    user = db.query(User).filter(User.id == user_id).first()
+    # 加行锁，保证差额与写入时的余额一致
+    user = db.query(User).filter(User.id == user_id).with_for_update().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    # 以差额写入流水，保证余额可由流水对账
+    adjustment = Transaction(
+        user_id=user.id,
+        amount=0,
+        credits=request.amount - (user.balance or 0.0),
+        type="adjustment",
+        description="Admin balance adjustment",
+        timestamp=time.time()
+    )
     user.balance = request.amount
+    db.add(adjustment)
     db.commit()
     db.refresh(user)
     return {"status": "success", "message": f"User {user.username} balance updated to {request.amount}", "new_balance": request.amount}
 
+class ReconcileRequest(BaseModel):
+    password: str
+    full: bool = False
+    repair: bool = False
+
+# 接口只列出前若干条不一致记录，完整列表用命令行 python -m backend.reconcile 查看
+RECONCILE_REPORT_LIMIT = 100
+
+@app.post("/api/admin/reconcile")
+def run_reconcile(request: ReconcileRequest, db: Session = Depends(get_db)):
+    if request.password != APP_CONFIG["admin_password"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        return reconcile(db, full=request.full, fix=request.repair, report_limit=RECONCILE_REPORT_LIMIT)
+    except BaselineMissing as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+# --- Export Routes ---
+
+def export_response(table: str, format: str, **filters):
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    filename = f"{table}.{format}"
+    return StreamingResponse(
+        stream_export(table, format, **filters),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+@app.get("/api/admin/export/users")
+async def export_users(password: str, format: str = "csv", after_id: int = 0):
+    if password != APP_CONFIG["admin_password"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return export_response("users", format, after_id=after_id)
+
+@app.get("/api/admin/export/transactions")
+async def export_transactions(password: str, format: str = "csv", start: Optional[float] = None, end: Optional[float] = None, after_id: int = 0):
+    if password != APP_CONFIG["admin_password"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return export_response("transactions", format, start=start, end=end, after_id=after_id)
+
 # --- Template Routes ---
 
+TEMPLATE_COLUMNS = (
+    PromptTemplate.id,
+    PromptTemplate.name,
+    PromptTemplate.content,
+    PromptTemplate.category,
+    PromptTemplate.is_active,
+)
+
 @app.get("/api/templates", response_model=List[PromptTemplateOut])
 async def get_public_templates(db: Session = Depends(get_db)):
-    return db.query(PromptTemplate).filter(PromptTemplate.is_active == True).all()
+    templates = db.query(*TEMPLATE_COLUMNS).filter(PromptTemplate.is_active == True)
+    return FastJSONResponse(rows_to_dicts(templates))
 
 @app.get("/api/admin/templates", response_model=List[PromptTemplateOut])
 async def get_all_templates(password: str, db: Session = Depends(get_db)):
     if password != APP_CONFIG["admin_password"]:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    return db.query(PromptTemplate).all()
+    return FastJSONResponse(rows_to_dicts(db.query(*TEMPLATE_COLUMNS)))
 
 @app.post("/api/admin/templates", response_model=PromptTemplateOut)
 async def create_template(request: PromptTemplateCreate, password: str, db: Session = Depends(get_db)):
@@ -417,7 +574,10 @@ async def delete_template(template_id: int, password: str, db: Session = Depends
 
 # --- Generation API Helper ---
 
-def call_external_api(url: str, key: str, payload: dict):
+# 日志中保留的上游错误响应长度
+UPSTREAM_ERROR_LIMIT = 500
+
+def call_external_api(url: str, key: str, payload: dict, adapter: ResponseAdapter) -> GenerationResult:
     if not url or not key:
          raise HTTPException(status_code=500, detail="Real API Configuration missing (URL or Key). Please configure in Admin Panel.")
     
@@ -427,178 +587,211 @@ def call_external_api(url: str, key: str, payload: dict):
     }
     
     try:
-        # 增加超时时间到 60s
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
-        
-        if response.status_code != 200:
+        # 增加超时时间到 60s；流式读取，内联的大文件直接写入存储
+        with requests.post(url, json=payload, headers=headers, timeout=60, stream=True) as response:
+            if response.status_code != 200:
+                # 只读取错误信息的开头部分记录到日志，不把整个响应体读入内存，也不返回给前端
+                error_detail = response.raw.read(UPSTREAM_ERROR_LIMIT, decode_content=True).decode("utf-8", errors="replace")
+                print(f"Upstream API Error from {url}: HTTP {response.status_code} {error_detail}")
+                lifecycle.record_provider_result(url, response.status_code < 500, f"HTTP {response.status_code}")
+                raise HTTPException(status_code=response.status_code, detail=f"Upstream API Error (HTTP {response.status_code})")
+
             try:
-                error_detail = response.json()
-            except:
-                error_detail = response.text
-            raise HTTPException(status_code=response.status_code, detail=f"Upstream API Error: {error_detail}")
-            
-        return response.json()
+                result = adapter.parse(response.iter_content(chunk_size=64 * 1024), MEDIA_STORE)
+            except ValueError as e:
+                lifecycle.record_provider_result(url, False, f"Invalid JSON: {e}")
+                raise HTTPException(status_code=502, detail="Upstream API returned an invalid response")
     except requests.exceptions.RequestException as e:
+        lifecycle.record_provider_result(url, False, str(e))
         raise HTTPException(status_code=500, detail=f"Network Error: {str(e)}")
 
+    if result is None:
+        lifecycle.record_provider_result(url, False, "No result in response")
+        raise HTTPException(status_code=502, detail=f"Upstream API response did not contain a result ({adapter.media_type})")
+    lifecycle.record_provider_result(url, True)
+    return result
+
+def preprocess_prompt(text: str, variables: Optional[Dict[str, str]] = None, required: bool = True) -> str:
+    """在扣费前规范化并校验提示词，不通过时返回 400"""
+    if not required and not (text or "").strip():
+        return ""
+    try:
+        return PROMPT_PIPELINE.run(text or "", variables)
+    except PromptRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 def deduct_credits(user: User, cost: float, db: Session):
-    if user.balance < cost:
+    # 条件 UPDATE 原子地检查并扣减余额，并发请求不会透支或互相覆盖
+    updated = (
+        db.query(User)
+        .filter(User.id == user.id, User.balance >= cost)
+        .update({User.balance: User.balance - cost}, synchronize_session=False)
+    )
+    if not updated:
+        db.rollback()
+        db.refresh(user)
         raise HTTPException(status_code=402, detail=f"Insufficient balance. Required: {cost}, Available: {user.balance}")
-    user.balance -= cost
+    if not lifecycle.record_charge(user.id, cost):
+        db.rollback()
+        raise HTTPException(status_code=503, detail="Server is restarting, please retry shortly")
     # 记录消费
     tx = Transaction(user_id=user.id, amount=0, credits=-cost, type="usage", description="API Usage", timestamp=time.time())
     db.add(tx)
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        lifecycle.release_charge(cost)
+        raise
+    db.refresh(user)
+
+def save_generation(db: Session, user: User, kind: str, prompt: str, result_url: str, cost: float, background_tasks: BackgroundTasks):
+    """记录到作品库，结果转存和缩略图在响应返回后由后台任务完成"""
+    generation = Generation(user_id=user.id, kind=kind, prompt=prompt, result_url=result_url, cost=cost, created_at=time.time())
+    db.add(generation)
     db.commit()
+    # 模拟模式的示例视频有上百 MB，不转存
+    persist = PERSIST_RESULTS and not APP_CONFIG["mock_mode"]
+    background_tasks.add_task(create_thumbnail, generation.id, MEDIA_STORE, persist)
 
 # --- Generation Endpoints ---
 
 @app.post("/api/generate-video")
-async def generate_video(request: VideoRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def generate_video(request: VideoRequest, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    prompt = preprocess_prompt(request.prompt, request.variables)
     deduct_credits(current_user, PRICING["video"], db)
     
-    if not request.prompt:
-        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
-    
     # Mock Call
     if APP_CONFIG["mock_mode"]:
         time.sleep(3)
+        video_url = "https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4"
+        save_generation(db, current_user, "video", prompt, video_url, PRICING["video"], background_tasks)
         return {
             "status": "success",
-            "video_url": "https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4",
+            "video_url": video_url,
             "message": "模拟生成视频成功 (-50 Credits)"
         }
     
     # Real Call
     payload = {
         "model": "sora-1.0", # 假设模型名
-        "prompt": request.prompt,
+        "prompt": prompt,
         "size": request.size,
         "duration": request.duration
     }
     # 尝试调用
-    result = call_external_api(APP_CONFIG["sora_api_url"], APP_CONFIG["sora_api_key"], payload)
+    result = call_external_api(APP_CONFIG["sora_api_url"], APP_CONFIG["sora_api_key"], payload, ADAPTERS["sora"])
     
-    # 假设返回结构中包含 url 或 data[0].url
-    video_url = result.get("video_url") or result.get("url") or (result.get("data") and result["data"][0].get("url"))
+    save_generation(db, current_user, "video", prompt, result.url, PRICING["video"], background_tasks)
     
-    if not video_url:
-        # 如果无法解析标准格式，直接返回整个结果供调试
-        return {"status": "success", "data": result, "message": "API Called (Check data for URL)"}
-        
-    return {"status": "success", "video_url": video_url, "message": "Video Generated Successfully"}
+    return {"status": "success", "video_url": result.url, "message": "Video Generated Successfully"}
 
 @app.post("/api/generate-image")
-async def generate_image(request: ImageRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def generate_image(request: ImageRequest, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    prompt = preprocess_prompt(request.prompt, request.variables)
     deduct_credits(current_user, PRICING["image"], db)
     
-    if not request.prompt:
-        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
-    
     if APP_CONFIG["mock_mode"]:
         time.sleep(2)
+        image_url = "https://picsum.photos/1024/1024"
+        save_generation(db, current_user, "image", prompt, image_url, PRICING["image"], background_tasks)
         return {
             "status": "success",
-            "image_url": "https://picsum.photos/1024/1024",
+            "image_url": image_url,
             "message": "模拟生成图片成功 (-10 Credits)"
         }
 
     # Real Call (Compatible with OpenAI DALL-E 3)
     payload = {
         "model": "dall-e-3",
-        "prompt": request.prompt,
+        "prompt": prompt,
         "n": 1,
         "size": request.size
     }
     
-    result = call_external_api(APP_CONFIG["image_api_url"], APP_CONFIG["image_api_key"], payload)
+    result = call_external_api(APP_CONFIG["image_api_url"], APP_CONFIG["image_api_key"], payload, ADAPTERS["image"])
     
-    image_url = result.get("image_url") or result.get("url") or (result.get("data") and result["data"][0].get("url"))
+    save_generation(db, current_user, "image", prompt, result.url, PRICING["image"], background_tasks)
     
-    if not image_url:
-        return {"status": "success", "data": result, "message": "API Called (Check data for URL)"}
-        
-    return {"status": "success", "image_url": image_url, "message": "Image Generated Successfully"}
+    return {"status": "success", "image_url": result.url, "message": "Image Generated Successfully"}
 
 @app.post("/api/generate-music")
-async def generate_music(request: MusicRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def generate_music(request: MusicRequest, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    prompt = preprocess_prompt(request.prompt, request.variables)
     deduct_credits(current_user, PRICING["music"], db)
     
-    if not request.prompt:
-        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
-    
     if APP_CONFIG["mock_mode"]:
         time.sleep(2)
+        audio_url = "https://www.soundhelix.com/examples/mp3/SoundHelix-Song-1.mp3"
+        save_generation(db, current_user, "music", prompt, audio_url, PRICING["music"], background_tasks)
         return {
             "status": "success",
-            "audio_url": "https://www.soundhelix.com/examples/mp3/SoundHelix-Song-1.mp3",
+            "audio_url": audio_url,
             "message": "模拟生成音乐成功 (-20 Credits)"
         }
 
     # Real Call
     payload = {
-        "prompt": request.prompt,
+        "prompt": prompt,
         "duration": request.duration
     }
     
-    result = call_external_api(APP_CONFIG["suno_api_url"], APP_CONFIG["suno_api_key"], payload)
+    result = call_external_api(APP_CONFIG["suno_api_url"], APP_CONFIG["suno_api_key"], payload, ADAPTERS["suno"])
     
-    audio_url = result.get("audio_url") or result.get("url") or (result.get("data") and result["data"][0].get("url"))
+    save_generation(db, current_user, "music", prompt, result.url, PRICING["music"], background_tasks)
     
-    if not audio_url:
-        return {"status": "success", "data": result, "message": "API Called (Check data for URL)"}
-
-    return {"status": "success", "audio_url": audio_url, "message": "Music Generated Successfully"}
+    return {"status": "success", "audio_url": result.url, "message": "Music Generated Successfully"}
 
 @app.post("/api/generate-avatar")
-async def generate_avatar(request: AvatarRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    deduct_credits(current_user, PRICING["avatar"], db)
-    
-    if not request.text:
+def generate_avatar(request: AvatarRequest, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if not request.text or not request.text.strip():
         raise HTTPException(status_code=400, detail="Text cannot be empty")
+    text = preprocess_prompt(request.text, request.variables)
+    prompt = preprocess_prompt(request.prompt, request.variables, required=False)
+    deduct_credits(current_user, PRICING["avatar"], db)
     
     if APP_CONFIG["mock_mode"]:
         time.sleep(2)
+        video_url = "https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/ElephantsDream.mp4"
+        save_generation(db, current_user, "avatar", text, video_url, PRICING["avatar"], background_tasks)
         return {
             "status": "success",
-            "video_url": "https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/ElephantsDream.mp4",
+            "video_url": video_url,
             "message": "模拟生成数字人成功 (-30 Credits)"
         }
 
     # Real Call
     payload = {
-        "text": request.text,
-        "prompt": request.prompt
+        "text": text,
+        "prompt": prompt
     }
     
-    result = call_external_api(APP_CONFIG["heygem_api_url"], APP_CONFIG["heygem_api_key"], payload)
+    result = call_external_api(APP_CONFIG["heygem_api_url"], APP_CONFIG["heygem_api_key"], payload, ADAPTERS["heygem"])
     
-    video_url = result.get("video_url") or result.get("url") or (result.get("data") and result["data"][0].get("url"))
+    save_generation(db, current_user, "avatar", text, result.url, PRICING["avatar"], background_tasks)
     
-    if not video_url:
-        return {"status": "success", "data": result, "message": "API Called (Check data for URL)"}
-
-    return {"status": "success", "video_url": video_url, "message": "Avatar Generated Successfully"}
+    return {"status": "success", "video_url": result.url, "message": "Avatar Generated Successfully"}
 
 @app.post("/api/generate-canvas")
-async def generate_canvas(request: CanvasRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def generate_canvas(request: CanvasRequest, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    prompt = preprocess_prompt(request.prompt, request.variables)
     deduct_credits(current_user, PRICING["image"], db)
     
-    if not request.prompt:
-        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
-    
     if APP_CONFIG["mock_mode"]:
         time.sleep(2)
         # Random image to simulate change
+        image_url = f"https://picsum.photos/1024/1024?random={int(time.time())}"
+        save_generation(db, current_user, "canvas", prompt, image_url, PRICING["image"], background_tasks)
         return {
             "status": "success",
-            "image_url": f"https://picsum.photos/1024/1024?random={int(time.time())}",
+            "image_url": image_url,
             "message": "模拟画布生成成功 (-10 Credits)"
         }
 
     # Real Call (Compatible with OpenAI DALL-E 3 or similar)
     payload = {
         "model": "dall-e-3",
-        "prompt": request.prompt,
+        "prompt": prompt,
         "n": 1,
         "size": request.size
     }
@@ -610,14 +803,85 @@ async def generate_canvas(request: CanvasRequest, current_user: User = Depends(g
         # Edits endpoint takes FormData. 
         # But many proxy APIs allow base64 in JSON. We assume such capability or a custom backend.
     
-    result = call_external_api(APP_CONFIG["image_api_url"], APP_CONFIG["image_api_key"], payload)
+    result = call_external_api(APP_CONFIG["image_api_url"], APP_CONFIG["image_api_key"], payload, ADAPTERS["image"])
     
-    image_url = result.get("image_url") or result.get("url") or (result.get("data") and result["data"][0].get("url"))
+    save_generation(db, current_user, "canvas", prompt, result.url, PRICING["image"], background_tasks)
     
-    if not image_url:
-        return {"status": "success", "data": result, "message": "API Called (Check data for URL)"}
-        
-    return {"status": "success", "image_url": image_url, "message": "Canvas Generated Successfully"}
+    return {"status": "success", "image_url": result.url, "message": "Canvas Generated Successfully"}
+
+# --- Gallery ---
+
+GALLERY_PAGE_SIZE = 24
+GALLERY_MAX_PAGE_SIZE = 100
+
+def parse_gallery_cursor(cursor: str):
+    """游标格式为 "<created_at>_<id>"，即上一页最后一条记录"""
+    try:
+        created_at, generation_id = cursor.split("_")
+        return float(created_at), int(generation_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/api/generations")
+def get_generations(cursor: Optional[str] = None, limit: int = GALLERY_PAGE_SIZE, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    limit = max(1, min(limit, GALLERY_MAX_PAGE_SIZE))
+    query = db.query(
+        Generation.id,
+        Generation.kind,
+        Generation.prompt,
+        Generation.result_url,
+        Generation.thumbnail_url,
+        Generation.created_at,
+    ).filter(Generation.user_id == current_user.id)
+
+    # 基于 (user_id, created_at) 索引的键集分页，翻页深度不影响查询代价
+    if cursor:
+        created_at, generation_id = parse_gallery_cursor(cursor)
+        query = query.filter(or_(
+            Generation.created_at < created_at,
+            and_(Generation.created_at == created_at, Generation.id < generation_id),
+        ))
+
+    items = rows_to_dicts(query.order_by(Generation.created_at.desc(), Generation.id.desc()).limit(limit + 1))
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = f"{items[-1]['created_at']!r}_{items[-1]['id']}"
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+# --- Health Checks ---
+
+PROVIDERS = ["sora", "veo", "suno", "heygem", "image"]
+
+@app.get("/healthz")
+async def liveness():
+    return {"status": "ok", "uptime": time.time() - lifecycle.SERVER_STATE["started_at"]}
+
+@app.get("/readyz")
+def readiness():
+    db_error = lifecycle.check_database()
+    providers = {}
+    for name in PROVIDERS:
+        url = APP_CONFIG[f"{name}_api_url"]
+        if APP_CONFIG["mock_mode"]:
+            providers[name] = {"status": "mock"}
+        elif not url or not APP_CONFIG[f"{name}_api_key"]:
+            providers[name] = {"status": "unconfigured"}
+        elif url not in lifecycle.PROVIDER_HEALTH:
+            providers[name] = {"status": "unknown"}
+        else:
+            health = lifecycle.PROVIDER_HEALTH[url]
+            providers[name] = {"status": "ok" if health["ok"] else "error", "error": health["error"], "checked_at": health["timestamp"]}
+
+    ready = db_error is None and not lifecycle.SERVER_STATE["draining"]
+    body = {
+        "status": "ready" if ready else "unavailable",
+        "draining": lifecycle.SERVER_STATE["draining"],
+        "database": {"status": "ok"} if db_error is None else {"status": "error", "error": db_error},
+        "providers": providers,
+        "inflight": len(lifecycle.INFLIGHT),
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
 
 # --- Static Files ---
 
@@ -631,6 +895,16 @@ if not os.path.exists(frontend_dir):
 if os.path.exists(frontend_dir):
     app.mount("/static", StaticFiles(directory=frontend_dir), name="static")
 
+class CachedStaticFiles(StaticFiles):
+    """媒体文件名唯一且内容不变，允许浏览器长期缓存"""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+app.mount("/media", CachedStaticFiles(directory=MEDIA_STORE.directory), name="media")
+
 @app.get("/admin")
 async def read_admin():
     admin_path = os.path.join(frontend_dir, 'admin.html')
@@ -646,5 +920,6 @@ async def read_index():
     return {"message": "API Running"}
 
 if __name__ == "__main__":
+    # 开发用单进程；生产环境使用 python -m backend.serve
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
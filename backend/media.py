@@ -0,0 +1,154 @@
+"""生成结果的本地媒体存储 (上游内联返回的 base64 文件，以及转存的上游结果)
+
+文件保存在 MEDIA_DIR 下，由 main.py 挂载到 /media 路径对外提供。
+"""
+import base64
+import binascii
+import mimetypes
+import os
+import re
+import uuid
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+# Vercel 只有 /tmp 可写
+if os.getenv("VERCEL"):
+    MEDIA_DIR = os.getenv("MEDIA_DIR", "/tmp/media")
+else:
+    MEDIA_DIR = os.getenv("MEDIA_DIR", os.path.join(project_root, "media"))
+MEDIA_URL_PREFIX = "/media/"
+# 是否把上游结果转存到本地并改写作品的 result_url。只在 MEDIA_DIR 为持久存储时开启：
+# Vercel 的 /tmp 各实例独立且冷启动后清空，转存的链接会失效
+PERSIST_RESULTS = os.getenv("PERSIST_RESULTS", "false").lower() == "true"
+
+# 转存上游结果文件的大小上限
+MAX_DOWNLOAD_BYTES = int(os.getenv("MAX_DOWNLOAD_BYTES", 500 * 1024 * 1024))
+
+DATA_URL_RE = re.compile(r"data:([\w.+-]+/[\w.+-]+)?(;[^,]*)?,")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def extension_for(mime: Optional[str], default: str) -> str:
+    if mime:
+        guessed = mimetypes.guess_extension(mime)
+        if guessed:
+            return guessed
+    return default
+
+
+class Base64Writer:
+    """把 base64 文本 (可带 data: 前缀) 分块解码写入文件，内存占用与文件大小无关"""
+
+    def __init__(self, store: "MediaStore", default_ext: str):
+        self.store = store
+        self.default_ext = default_ext
+        self.path = None
+        self.url = None
+        self.pending = ""
+        self.failed = False
+
+    def _open(self, ext: str):
+        self.path, self.url = self.store.new_file(ext)
+        self.file = open(self.path, "wb")
+
+    def feed(self, text: str):
+        if self.failed:
+            return
+        if self.path is None:
+            mime = None
+            match = DATA_URL_RE.match(text)
+            if match:
+                mime = match.group(1)
+                text = text[match.end():]
+            self._open(extension_for(mime, self.default_ext))
+        data = self.pending + WHITESPACE_RE.sub("", text)
+        aligned = len(data) - len(data) % 4
+        self.pending = data[aligned:]
+        try:
+            self.file.write(base64.b64decode(data[:aligned], validate=True))
+        except binascii.Error:
+            self.failed = True
+
+    def close(self) -> Optional[str]:
+        """返回对外 URL；内容不是合法 base64 时删除文件并返回 None"""
+        if self.path is None:
+            return None
+        if not self.failed and self.pending:
+            try:
+                self.file.write(base64.b64decode(self.pending + "=" * (-len(self.pending) % 4), validate=True))
+            except binascii.Error:
+                self.failed = True
+        self.file.close()
+        if self.failed:
+            os.remove(self.path)
+            return None
+        return self.url
+
+    def discard(self):
+        """放弃写到一半的文件"""
+        if self.path is None:
+            return
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class MediaStore:
+    def __init__(self, directory: str = MEDIA_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def new_file(self, ext: str, prefix: str = "") -> Tuple[str, str]:
+        """返回 (本地路径, 对外 URL)，文件名唯一，内容不会再改变"""
+        filename = prefix + uuid.uuid4().hex + ext
+        return os.path.join(self.directory, filename), MEDIA_URL_PREFIX + filename
+
+    def writer(self, default_ext: str = ".bin") -> Base64Writer:
+        return Base64Writer(self, default_ext)
+
+    def save_base64(self, text: str, default_ext: str = ".bin") -> Optional[str]:
+        writer = self.writer(default_ext)
+        writer.feed(text)
+        return writer.close()
+
+    def download(self, url: str, default_ext: str = ".bin", limit: int = MAX_DOWNLOAD_BYTES) -> Optional[str]:
+        """把远程文件流式写入存储，返回本地 URL；下载失败或超过 limit 时返回 None"""
+        if not url.startswith(("http://", "https://")):
+            return None
+        ext = os.path.splitext(urlparse(url).path)[1].lower()
+        path = None
+        try:
+            with requests.get(url, timeout=60, stream=True) as response:
+                if response.status_code != 200:
+                    return None
+                if not ext or len(ext) > 5:
+                    mime = response.headers.get("Content-Type", "").split(";")[0].strip()
+                    ext = extension_for(mime if mime != "application/octet-stream" else None, default_ext)
+                path, local_url = self.new_file(ext)
+                size = 0
+                with open(path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        size += len(chunk)
+                        if size > limit:
+                            raise ValueError("file too large")
+                        f.write(chunk)
+                return local_url
+        except (requests.exceptions.RequestException, OSError, ValueError):
+            if path and os.path.exists(path):
+                os.remove(path)
+            return None
+
+    def path_for(self, url: str) -> Optional[str]:
+        if not url.startswith(MEDIA_URL_PREFIX):
+            return None
+        return os.path.join(self.directory, os.path.basename(url))
+
+    def delete(self, url: str):
+        path = self.path_for(url)
+        if path and os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,169 @@
+"""生成请求的提示词预处理流水线 (在扣费和调用上游之前执行)
+
+每个阶段都是 stage(text, variables) -> text 的可调用对象：返回改写后的文本，
+或抛出 PromptRejected 拒绝请求。PromptPipeline 按顺序执行各阶段，
+可通过 add_stage() 插入自定义阶段。
+"""
+import re
+import unicodedata
+from typing import Callable, Dict, Iterable, List, Optional
+
+Stage = Callable[[str, Dict[str, str]], str]
+
+# 模板中的占位符，例如 [SUBJECT]
+PLACEHOLDER_RE = re.compile(r"\[([A-Z][A-Z0-9_]*)\]")
+WHITESPACE_RE = re.compile(r"\s+")
+# 除空白以外的控制字符，以及零宽 / 方向控制字符
+INVISIBLE_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\u200b-\u200f\u202a-\u202e\u2060-\u2064\ufeff]")
+
+
+class PromptRejected(ValueError):
+    """提示词未通过预处理，message 可直接返回给用户"""
+
+
+def normalize_text(text: str, variables: Dict[str, str]) -> str:
+    """NFKC 归一化 (全角转半角等)，去除控制字符并合并连续空白"""
+    text = INVISIBLE_RE.sub("", unicodedata.normalize("NFKC", text))
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+
+def expand_placeholders(text: str, variables: Dict[str, str]) -> str:
+    """用 variables 填充 [NAME] 占位符；仍有未填充的占位符时拒绝，避免白白扣费。
+
+    只在请求带了 variables (即按模板生成) 时展开，自由输入的提示词中的 [HDR]
+    之类原样保留。填入的值来自用户输入，替换后对整段文本重新归一化，
+    防止用全角 / 零宽字符绕过屏蔽词。
+    """
+    missing = []
+
+    def replace(match):
+        name = match.group(1)
+        value = variables.get(name) or variables.get(name.lower())
+        if value is None:
+            missing.append(match.group(0))
+            return match.group(0)
+        return value
+
+    if not variables or "[" not in text:
+        return text
+    text = PLACEHOLDER_RE.sub(replace, text)
+    if missing:
+        raise PromptRejected(f"Please fill in the template placeholder(s): {', '.join(missing)}")
+    return normalize_text(text, variables)
+
+
+class LengthLimit:
+    def __init__(self, max_length: int = 2000, min_length: int = 1):
+        self.max_length = max_length
+        self.min_length = min_length
+
+    def __call__(self, text: str, variables: Dict[str, str]) -> str:
+        if len(text) < self.min_length:
+            raise PromptRejected("Prompt cannot be empty")
+        if len(text) > self.max_length:
+            raise PromptRejected(f"Prompt is too long ({len(text)} > {self.max_length} characters)")
+        return text
+
+
+def compile_keyword_trie(words: Iterable[str]) -> str:
+    """把关键词集合编译成共享前缀的正则 (如 bad|ban -> ba(?:d|n))。
+
+    re 对普通交替会逐个尝试每个关键词，词表大时非常慢；按前缀树展开后，
+    每个位置只沿一条路径向下匹配，效果接近 Aho-Corasick。
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node) -> str:
+        ending = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 and not ending else "(?:" + "|".join(branches) + ")"
+        return body + "?" if ending else body
+
+    return build(trie)
+
+
+def fold_case(text: str) -> str:
+    """小写化并保持长度不变，使匹配位置可以映射回原文"""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(char.lower()[:1] for char in text)
+
+
+class Blocklist:
+    """关键词 (前缀树) 和正则合并为一个正则，在小写化的文本上一次扫描完成匹配。
+    正则忽略大小写，其中的大写字母 (如 KILL) 同样能命中。
+
+    mode="reject" 命中即拒绝；mode="mask" 把命中的片段替换为 *。
+    """
+
+    def __init__(self, keywords: Iterable[str] = (), patterns: Iterable[str] = (), mode: str = "reject"):
+        if mode not in ("reject", "mask"):
+            raise ValueError(f"Unknown blocklist mode: {mode}")
+        self.mode = mode
+        words = {fold_case(k.strip()) for k in keywords if k and k.strip()}
+        alternatives = []
+        for pattern in patterns:
+            if not pattern or not pattern.strip():
+                continue
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"Invalid blocklist pattern {pattern!r}: {e}")
+            # 只对正则忽略大小写，关键词已小写化，前缀树保持区分大小写以免变慢
+            alternatives.append(f"(?i:{pattern})")
+        if words:
+            alternatives.insert(0, compile_keyword_trie(words))
+        self.regex = re.compile("|".join(alternatives)) if alternatives else None
+
+    def __call__(self, text: str, variables: Dict[str, str]) -> str:
+        if self.regex is None:
+            return text
+        folded = fold_case(text)
+        if self.mode == "reject":
+            if self.regex.search(folded):
+                raise PromptRejected("Prompt contains blocked content")
+            return text
+        parts = []
+        last = 0
+        for match in self.regex.finditer(folded):
+            start, end = match.span()
+            parts.append(text[last:start])
+            parts.append("*" * (end - start))
+            last = end
+        parts.append(text[last:])
+        return "".join(parts)
+
+
+class PromptPipeline:
+    def __init__(self, stages: Optional[List[Stage]] = None):
+        self.stages = list(stages or [])
+
+    def add_stage(self, stage: Stage, index: Optional[int] = None):
+        if index is None:
+            self.stages.append(stage)
+        else:
+            self.stages.insert(index, stage)
+
+    def run(self, text: str, variables: Optional[Dict[str, str]] = None) -> str:
+        variables = variables or {}
+        for stage in self.stages:
+            text = stage(text, variables)
+        return text
+
+
+def build_default_pipeline(blocklist: Iterable[str] = (), patterns: Iterable[str] = (),
+                           max_length: int = 2000, blocklist_mode: str = "reject") -> PromptPipeline:
+    return PromptPipeline([
+        normalize_text,
+        expand_placeholders,
+        LengthLimit(max_length=max_length),
+        Blocklist(blocklist, patterns, mode=blocklist_mode),
+    ])
@@ -0,0 +1,269 @@
+"""余额对账：用交易流水 SUM(credits) 重新计算每个用户的余额并与 User.balance 比对
+
+增量模式只检查上次检查点 (JobCheckpoint "reconcile") 之后有新交易的用户：
+按主键区间把新交易扫描一遍，收集涉及的用户；--full 则按主键遍历全部用户。
+每批 RECONCILE_BATCH_SIZE 个用户只需一条查询 (users 连接按用户聚合的流水)，
+余额和流水合计来自同一条语句，读到的是同一时刻的快照。
+
+检查点只推进到 RECONCILE_LAG_SECONDS 之前的交易：Postgres 的序列号在提交前分配，
+编号较小的交易可能晚于编号较大的交易提交，留出延迟避免漏掉。
+
+早于流水记账的老用户 (注册赠送、旧版后台直接改余额) 没有对应流水，
+修复前必须先执行一次 --backfill，为每个用户写入一条期初余额调整流水；
+没有期初基线时拒绝 --repair。--backfill 同时为已有的表补建增量扫描依赖的
+transactions.user_id / timestamp 索引 (create_all 不会补建)。
+
+命令行用法:
+    python -m backend.reconcile --backfill          # 一次性补建索引、写入期初余额
+    python -m backend.reconcile                     # 单次增量对账，只报告
+    python -m backend.reconcile --full --repair     # 全量对账并修复
+    python -m backend.reconcile --repair --interval 3600   # 每小时运行
+"""
+import argparse
+import time
+from typing import Iterator, List, Optional
+
+from sqlalchemy import func, select
+
+try:
+    from backend.database import SessionLocal, User, Transaction, JobCheckpoint, ensure_indexes
+except ImportError:
+    from database import SessionLocal, User, Transaction, JobCheckpoint, ensure_indexes
+
+RECONCILE_BATCH_SIZE = 1000
+# 增量扫描时每次读取的交易主键区间宽度
+RECONCILE_SCAN_WINDOW = 50000
+# 检查点只推进到这么多秒之前的交易
+RECONCILE_LAG_SECONDS = 300
+CHECKPOINT_NAME = "reconcile"
+BASELINE_NAME = "reconcile_baseline"
+# 浮点累加误差容忍度
+BALANCE_TOLERANCE = 1e-6
+
+
+class BaselineMissing(RuntimeError):
+    """尚未写入期初余额，修复会抹掉老用户的余额"""
+
+
+def get_checkpoint(db, name: str = CHECKPOINT_NAME) -> Optional[int]:
+    checkpoint = db.get(JobCheckpoint, name)
+    return checkpoint.value if checkpoint else None
+
+
+def save_checkpoint(db, value: int, name: str = CHECKPOINT_NAME):
+    checkpoint = db.get(JobCheckpoint, name)
+    if checkpoint is None:
+        checkpoint = JobCheckpoint(name=name)
+        db.add(checkpoint)
+    checkpoint.value = value
+    checkpoint.updated_at = time.time()
+    db.commit()
+
+
+def has_baseline(db) -> bool:
+    return get_checkpoint(db, BASELINE_NAME) is not None
+
+
+def safe_high_water(db, since: int, lag: float = RECONCILE_LAG_SECONDS) -> int:
+    """返回可以安全推进到的交易主键：lag 秒之前最后一条交易"""
+    cutoff = time.time() - lag
+    last_id = (
+        db.query(Transaction.id)
+        .filter(Transaction.timestamp <= cutoff)
+        .order_by(Transaction.timestamp.desc(), Transaction.id.desc())
+        .limit(1)
+        .scalar()
+    )
+    return max(since, last_id or 0)
+
+
+def iter_all_users(db, batch_size: int = RECONCILE_BATCH_SIZE) -> Iterator[List[int]]:
+    last_id = 0
+    while True:
+        batch = [row[0] for row in db.query(User.id).filter(User.id > last_id).order_by(User.id).limit(batch_size)]
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1]
+
+
+def iter_dirty_users(db, since_tx_id: int, until_tx_id: int,
+                     batch_size: int = RECONCILE_BATCH_SIZE) -> Iterator[List[int]]:
+    """按主键区间把 (since, until] 内的交易扫描一遍，分批产出涉及的用户。
+
+    跨多个区间都有交易的用户可能被检查不止一次，结果不受影响。
+    """
+    pending = set()
+    low = since_tx_id
+    while low < until_tx_id:
+        high = min(low + RECONCILE_SCAN_WINDOW, until_tx_id)
+        pending.update(
+            row[0] for row in
+            db.query(Transaction.user_id).filter(Transaction.id > low, Transaction.id <= high).distinct()
+        )
+        low = high
+        if len(pending) >= batch_size or low >= until_tx_id:
+            user_ids = sorted(pending)
+            pending.clear()
+            for i in range(0, len(user_ids), batch_size):
+                yield user_ids[i:i + batch_size]
+
+
+def check_batch(db, user_ids: List[int]) -> List[dict]:
+    """返回这批用户中余额与流水合计不一致的记录 (余额和流水在同一条语句中读取)"""
+    ledger = (
+        select(Transaction.user_id, func.sum(Transaction.credits).label("total"))
+        .where(Transaction.user_id.in_(user_ids))
+        .group_by(Transaction.user_id)
+        .subquery()
+    )
+    rows = (
+        db.query(User.id, User.username, User.balance, func.coalesce(ledger.c.total, 0.0))
+        .outerjoin(ledger, ledger.c.user_id == User.id)
+        .filter(User.id.in_(user_ids))
+    )
+    discrepancies = []
+    for user_id, username, balance, expected in rows:
+        actual = balance or 0.0
+        if abs(expected - actual) > BALANCE_TOLERANCE:
+            discrepancies.append({
+                "user_id": user_id,
+                "username": username,
+                "balance": actual,
+                "ledger_balance": expected,
+                "difference": actual - expected,
+            })
+    return discrepancies
+
+
+def repair(db, discrepancies: List[dict]) -> int:
+    """在同一条 UPDATE 中重新计算流水合计并写回余额；余额在对账期间被改动过的用户跳过，留给下一轮"""
+    ledger_total = (
+        select(func.coalesce(func.sum(Transaction.credits), 0.0))
+        .where(Transaction.user_id == User.id)
+        .scalar_subquery()
+    )
+    repaired = 0
+    for item in discrepancies:
+        updated = (
+            db.query(User)
+            .filter(User.id == item["user_id"], User.balance == item["balance"])
+            .update({User.balance: ledger_total}, synchronize_session=False)
+        )
+        repaired += updated
+    db.commit()
+    return repaired
+
+
+def backfill_opening_balances(db) -> int:
+    """为余额与流水不一致的用户写入一条期初余额调整流水，只执行一次；返回写入条数"""
+    if has_baseline(db):
+        return 0
+    written = 0
+    for user_ids in iter_all_users(db):
+        # 并发扣费会同时改动余额和流水，差额不变，这里写入的调整仍然正确
+        for item in check_batch(db, user_ids):
+            db.add(Transaction(
+                user_id=item["user_id"],
+                amount=0,
+                credits=item["difference"],
+                type="adjustment",
+                description="Opening balance (ledger backfill)",
+                timestamp=time.time()
+            ))
+            written += 1
+        db.commit()
+    save_checkpoint(db, written, BASELINE_NAME)
+    return written
+
+
+def reconcile(db, full: bool = False, fix: bool = False, lag: float = RECONCILE_LAG_SECONDS,
+              report_limit: Optional[int] = None) -> dict:
+    """执行一轮对账并推进检查点；report_limit 限制报告中列出的不一致记录条数"""
+    if fix and not has_baseline(db):
+        raise BaselineMissing("Run 'python -m backend.reconcile --backfill' before repairing balances")
+
+    started = time.time()
+    since = get_checkpoint(db) or 0
+    high = safe_high_water(db, since, lag)
+    batches = iter_all_users(db) if full else iter_dirty_users(db, since, high)
+
+    checked = 0
+    repaired = 0
+    found_total = 0
+    discrepancies = []
+    for user_ids in batches:
+        found = check_batch(db, user_ids)
+        checked += len(user_ids)
+        if fix and found:
+            repaired += repair(db, found)
+        found_total += len(found)
+        if report_limit is None:
+            discrepancies.extend(found)
+        else:
+            discrepancies.extend(found[:report_limit - len(discrepancies)])
+        # 结束只读事务，避免长事务占用快照
+        db.rollback()
+
+    save_checkpoint(db, high)
+    return {
+        "mode": "full" if full else "incremental",
+        "since_transaction_id": None if full else since,
+        "checkpoint": high,
+        "users_checked": checked,
+        "discrepancy_count": found_total,
+        "discrepancies": discrepancies,
+        "repaired": repaired,
+        "elapsed": time.time() - started,
+    }
+
+
+def run_once(full: bool = False, fix: bool = False) -> dict:
+    db = SessionLocal()
+    try:
+        return reconcile(db, full=full, fix=fix)
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconcile user balances against the transaction ledger")
+    parser.add_argument("--backfill", action="store_true", help="Record opening-balance adjustments once, then exit")
+    parser.add_argument("--full", action="store_true", help="Check every user instead of only those with new transactions")
+    parser.add_argument("--repair", action="store_true", help="Set balances to the ledger sum")
+    parser.add_argument("--interval", type=float, default=0, help="Repeat every N seconds (0 = run once)")
+    args = parser.parse_args(argv)
+
+    if args.backfill:
+        for name in ensure_indexes():
+            print(f"Created index {name}")
+        db = SessionLocal()
+        try:
+            if has_baseline(db):
+                print("Opening balances already recorded")
+            else:
+                print(f"Recorded {backfill_opening_balances(db)} opening-balance adjustments")
+        finally:
+            db.close()
+        return
+
+    full = args.full
+    while True:
+        try:
+            report = run_once(full=full, fix=args.repair)
+        except BaselineMissing as e:
+            parser.exit(1, f"{e}\n")
+        for item in report["discrepancies"]:
+            print(f"user {item['user_id']} ({item['username']}): balance={item['balance']} ledger={item['ledger_balance']} diff={item['difference']}")
+        print(f"[{report['mode']}] checked {report['users_checked']} users, "
+              f"{report['discrepancy_count']} discrepancies, {report['repaired']} repaired, "
+              f"checkpoint={report['checkpoint']}, {report['elapsed']:.2f}s")
+        if not args.interval:
+            break
+        # 之后的轮次只做增量
+        full = False
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
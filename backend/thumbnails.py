@@ -0,0 +1,148 @@
+"""作品库后台处理：转存上游结果并制作缩略图，都保存到 MediaStore 长期缓存
+
+上游返回的多为带签名、会过期的 URL。开启 PERSIST_RESULTS (MEDIA_DIR 为持久存储时)
+后，响应返回后先把结果下载到本地并改写 result_url；下载失败时保留原 URL。
+模拟模式的示例文件不转存。
+
+缩略图需要 Pillow；未安装或原图无法处理时 thumbnail_url 留空，前端改用原图，
+安装 Pillow 后可以补做:
+    python -m backend.thumbnails
+视频和音频没有缩略图，由前端显示占位图标。
+"""
+import argparse
+import io
+import os
+from typing import Optional
+
+import requests
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    from backend.database import SessionLocal, Generation
+    from backend.media import MediaStore
+except ImportError:
+    from database import SessionLocal, Generation
+    from media import MediaStore
+
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_KINDS = {"image", "canvas"}
+# 下载原图的大小上限
+MAX_SOURCE_BYTES = 20 * 1024 * 1024
+# 原图像素上限 (约 40MP)；超过的不做缩略图，避免解码时占用过多内存
+MAX_IMAGE_PIXELS = 40_000_000
+
+if Image is not None:
+    # 超过 2 倍上限时 Image.open 抛出 DecompressionBombError
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# 上游 URL 没有扩展名时按作品类型决定
+RESULT_EXTENSIONS = {"image": ".png", "canvas": ".png", "video": ".mp4", "avatar": ".mp4", "music": ".mp3"}
+
+
+def load_source(url: str, store: MediaStore) -> Optional[bytes]:
+    local_path = store.path_for(url)
+    if local_path:
+        if not os.path.exists(local_path) or os.path.getsize(local_path) > MAX_SOURCE_BYTES:
+            return None
+        with open(local_path, "rb") as f:
+            return f.read()
+    if not url.startswith(("http://", "https://")):
+        return None
+    try:
+        with requests.get(url, timeout=30, stream=True) as response:
+            if response.status_code != 200:
+                return None
+            data = bytearray()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                data.extend(chunk)
+                if len(data) > MAX_SOURCE_BYTES:
+                    return None
+            return bytes(data)
+    except requests.exceptions.RequestException:
+        return None
+
+
+def build_thumbnail(kind: str, url: str, store: MediaStore) -> Optional[str]:
+    """返回缩略图 URL；不支持的类型或无法制作时返回 None"""
+    if kind not in THUMBNAIL_KINDS or Image is None:
+        return None
+    data = load_source(url, store)
+    if data is None:
+        return None
+    path, thumb_url = store.new_file(".jpg", prefix="thumb_")
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            # open 只读取文件头；1~2 倍上限之间 Pillow 只给出警告，这里在解码前拦下
+            width, height = img.size
+            if width * height > MAX_IMAGE_PIXELS:
+                raise Image.DecompressionBombError(f"image too large: {width}x{height}")
+            img.thumbnail(THUMBNAIL_SIZE)
+            img.convert("RGB").save(path, "JPEG", quality=80)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+    return thumb_url
+
+
+def persist_result(generation: Generation, store: MediaStore) -> bool:
+    """把远程结果转存到本地，成功时改写 result_url"""
+    if store.path_for(generation.result_url):
+        return False
+    local_url = store.download(generation.result_url, RESULT_EXTENSIONS.get(generation.kind, ".bin"))
+    if local_url is None:
+        print(f"Failed to persist result of generation {generation.id}, keeping remote URL")
+        return False
+    generation.result_url = local_url
+    return True
+
+
+def create_thumbnail(generation_id: int, store: MediaStore, persist: bool = False) -> bool:
+    """后台任务入口：persist 为真时先转存结果，再制作缩略图，已有缩略图时跳过。
+
+    返回是否新做了缩略图。
+    """
+    db = SessionLocal()
+    try:
+        generation = db.get(Generation, generation_id)
+        if generation is None:
+            return False
+        if persist and persist_result(generation, store):
+            db.commit()
+        if generation.thumbnail_url:
+            return False
+        thumbnail_url = build_thumbnail(generation.kind, generation.result_url, store)
+        if not thumbnail_url:
+            return False
+        generation.thumbnail_url = thumbnail_url
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+def backfill_thumbnails(store: MediaStore) -> int:
+    """为缺少缩略图的图片类作品补做缩略图，返回成功的数量"""
+    db = SessionLocal()
+    try:
+        ids = [row[0] for row in db.query(Generation.id).filter(
+            Generation.kind.in_(THUMBNAIL_KINDS), Generation.thumbnail_url.is_(None))]
+    finally:
+        db.close()
+    return sum(create_thumbnail(generation_id, store) for generation_id in ids)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create missing thumbnails for image generations")
+    parser.parse_args(argv)
+    if Image is None:
+        parser.exit(1, "Pillow is not installed (pip install pillow)\n")
+    print(f"Created {backfill_thumbnails(MediaStore())} thumbnails")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""提示词预处理流水线吞吐量 (prompts/sec)
+
+运行: python bench_prompt_pipeline.py [屏蔽词数量]
+"""
+import random
+import string
+import sys
+import time
+
+from backend.prompt_pipeline import build_default_pipeline, PromptRejected
+
+KEYWORDS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+PROMPTS = 20000
+
+random.seed(0)
+
+def random_word(n):
+    return "".join(random.choice(string.ascii_lowercase) for _ in range(n))
+
+blocklist = [random_word(random.randint(5, 10)) for _ in range(KEYWORDS)]
+pipeline = build_default_pipeline(blocklist=blocklist, patterns=[r"\bkill\s+\w+"])
+
+# 模拟真实提示词：多余空白、全角字符、模板占位符，少量命中屏蔽词
+prompts = []
+for i in range(PROMPTS):
+    words = [random_word(random.randint(3, 9)) for _ in range(random.randint(10, 40))]
+    if i % 4 == 0:
+        words.insert(0, "[SUBJECT]")
+    if i % 50 == 0:
+        words.append(random.choice(blocklist))
+    prompts.append("  ".join(words) + "　，高质量 ")
+variables = {"SUBJECT": "a cute cat"}
+
+rejected = 0
+start = time.perf_counter()
+for prompt in prompts:
+    try:
+        pipeline.run(prompt, variables)
+    except PromptRejected:
+        rejected += 1
+elapsed = time.perf_counter() - start
+
+print(f"Blocklist: {KEYWORDS} keywords, {PROMPTS} prompts ({rejected} rejected)")
+print(f"{PROMPTS / elapsed:,.0f} prompts/sec, {elapsed / PROMPTS * 1e6:.1f} us/prompt")
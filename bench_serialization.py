@@ -0,0 +1,62 @@
+"""对比 /api/admin/users 的序列化开销 (每 10k 行)
+
+旧路径: ORM 实例化 + pydantic(UserAdminView) 校验 + jsonable_encoder + json.dumps
+新路径: 列元组查询 + FastJSONResponse
+
+运行: python bench_serialization.py [行数]
+"""
+import os
+import sys
+import time
+
+# 使用独立的内存数据库，避免污染 sql_app.db
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from backend.database import SessionLocal, User
+from backend.main import FastJSONResponse, UserAdminView, rows_to_dicts
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+ROUNDS = 5
+
+db = SessionLocal()
+db.bulk_insert_mappings(User, [
+    {"username": f"user{i}", "hashed_password": "x", "email": f"user{i}@example.com", "balance": i * 1.5, "is_active": True}
+    for i in range(ROWS)
+])
+db.commit()
+
+adapter = TypeAdapter(List[UserAdminView])
+
+def old_path():
+    db.expunge_all()
+    users = db.query(User).all()
+    validated = adapter.validate_python(users, from_attributes=True)
+    return JSONResponse(jsonable_encoder(validated)).body
+
+def new_path():
+    users = db.query(User.id, User.username, User.email, User.balance, User.is_active)
+    return FastJSONResponse(rows_to_dicts(users)).body
+
+def bench(name, fn):
+    fn()  # 预热
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    per_10k = best * 10000 / ROWS
+    print(f"{name:<10} {best * 1000:8.1f} ms total, {per_10k * 1000:8.1f} ms / 10k rows")
+    return best
+
+print(f"Rows: {ROWS}, best of {ROUNDS}")
+old = bench("old", old_path)
+new = bench("new", new_path)
+print(f"Speedup: {old / new:.1f}x")
+
+db.close()
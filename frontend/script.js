@@ -34,6 +34,9 @@ document.addEventListener('DOMContentLoaded', () => {
                 if (tabId === 'canvas') {
                     setTimeout(initCanvas, 100);
                 }
+                if (tabId === 'gallery') {
+                    loadGallery(true);
+                }
             } else {
                 content.classList.remove('active');
             }
@@ -686,6 +689,70 @@ document.addEventListener('DOMContentLoaded', () => {
     // Load on init
     loadCanvasTemplates();
 
+    // === 8. 我的作品 (游标分页) ===
+    let galleryCursor = null;
+    const GALLERY_ICONS = { video: '🎬', avatar: '🧑‍💼', music: '🎵' };
+    const GALLERY_IMAGE_KINDS = ['image', 'canvas'];
+
+    async function loadGallery(reset) {
+        const grid = document.getElementById('gallery-grid');
+        const moreBtn = document.getElementById('galleryMoreBtn');
+        if (reset) {
+            grid.innerHTML = '';
+            galleryCursor = null;
+        }
+        if (!currentUser) {
+            grid.innerHTML = '<p>登录后查看历史作品</p>';
+            moreBtn.classList.add('hidden');
+            return;
+        }
+
+        try {
+            const query = galleryCursor ? `?cursor=${encodeURIComponent(galleryCursor)}` : '';
+            const data = await fetchWithAuth(`/api/generations${query}`);
+            if (!data) return;
+
+            data.items.forEach(item => {
+                const card = document.createElement('a');
+                card.className = 'gallery-item';
+                card.href = item.result_url;
+                card.target = '_blank';
+                card.title = item.prompt || '';
+                // 缩略图尚未生成或制作失败时，图片类作品直接显示原图
+                const isImage = GALLERY_IMAGE_KINDS.includes(item.kind);
+                const thumbnail = item.thumbnail_url || (isImage ? item.result_url : null);
+                if (thumbnail) {
+                    const img = document.createElement('img');
+                    img.src = thumbnail;
+                    img.loading = 'lazy';
+                    if (isImage && thumbnail !== item.result_url) {
+                        img.onerror = () => {
+                            img.onerror = null;
+                            img.src = item.result_url;
+                        };
+                    }
+                    card.appendChild(img);
+                } else {
+                    const icon = document.createElement('div');
+                    icon.className = 'gallery-icon';
+                    icon.textContent = GALLERY_ICONS[item.kind] || '🖼️';
+                    card.appendChild(icon);
+                }
+                grid.appendChild(card);
+            });
+
+            if (reset && data.items.length === 0) {
+                grid.innerHTML = '<p>还没有作品，快去生成吧</p>';
+            }
+            galleryCursor = data.next_cursor;
+            moreBtn.classList.toggle('hidden', !galleryCursor);
+        } catch (e) {
+            console.error('Failed to load gallery', e);
+        }
+    }
+
+    document.getElementById('galleryMoreBtn').addEventListener('click', () => loadGallery(false));
+
     // 初始化检查
     checkAuth();
 
@@ -0,0 +1,98 @@
+import base64
+import json
+import os
+
+import pytest
+
+from backend.adapters import ADAPTERS, STORED_MARKER, parse_streaming_json
+from backend.media import MediaStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MediaStore(str(tmp_path))
+
+
+def chunked(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def read_stored(store, url):
+    with open(store.path_for(url), "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_escapes_split_across_chunks(store, size):
+    payload = {"note": 'a "quoted" \\ back\\slash é 中文 \\u', "n": [1, 2.5, None, True]}
+    body = json.dumps(payload).encode()
+    parsed, stored = parse_streaming_json(chunked(body, size), store)
+    assert parsed == payload
+    assert stored == []
+
+
+@pytest.mark.parametrize("size", [1, 3, 4096])
+def test_long_base64_is_stored_not_inlined(store, size):
+    raw = os.urandom(3000)
+    encoded = base64.b64encode(raw).decode().replace("/", "\\/")
+    body = ('{"data": [{"b64_json": "' + encoded + '"}]}').encode()
+    parsed, stored = parse_streaming_json(chunked(body, size), store, ".png", limit=100)
+    value = parsed["data"][0]["b64_json"]
+    assert value.startswith(STORED_MARKER)
+    assert stored == [value[len(STORED_MARKER):]]
+    assert read_stored(store, stored[0]) == raw
+
+
+def test_data_url_keeps_mime_extension(store):
+    raw = os.urandom(5000)
+    body = json.dumps({"video": "data:video/webm;base64," + base64.b64encode(raw).decode()}).encode()
+    result = ADAPTERS["sora"].parse(chunked(body, 333), store)
+    assert result.url.endswith(".webm")
+    assert read_stored(store, result.url) == raw
+
+
+def test_small_data_url_is_saved(store):
+    body = json.dumps({"image_url": "data:image/png;base64," + base64.b64encode(b"png").decode()}).encode()
+    result = ADAPTERS["image"].parse([body], store)
+    assert result.url.startswith("/media/")
+    assert read_stored(store, result.url) == b"png"
+
+
+def test_long_non_base64_string_becomes_null(store):
+    body = json.dumps({"log": "not base64! " * 50, "url": "http://cdn/x.png"}).encode()
+    parsed, stored = parse_streaming_json(chunked(body, 17), store, limit=100)
+    assert parsed == {"log": None, "url": "http://cdn/x.png"}
+    assert stored == []
+    assert os.listdir(store.directory) == []
+
+
+def test_unused_stored_strings_are_deleted(store):
+    body = json.dumps({"id": "A" * 400, "data": [{"url": "http://cdn/x.mp4"}]}).encode()
+    parsed, stored = parse_streaming_json([body], store, limit=100)
+    assert len(stored) == 1
+    result = ADAPTERS["sora"].extract(parsed, store)
+    assert result.url == "http://cdn/x.mp4"
+    for url in stored:
+        store.delete(url)
+    assert os.listdir(store.directory) == []
+
+
+@pytest.mark.parametrize("body", [b"<html>", b'{"a": ', b'{"a": "' + b"A" * 400])
+def test_invalid_json_raises_and_cleans_up(store, body):
+    with pytest.raises(ValueError):
+        parse_streaming_json(chunked(body, 50), store, limit=100)
+    assert os.listdir(store.directory) == []
+
+
+def test_no_result_returns_none(store):
+    assert ADAPTERS["image"].parse([b'{"id": "abc"}'], store) is None
+
+
+@pytest.mark.parametrize("url", ["javascript:alert(1)", "JaVaScRiPt:alert(1)", "/etc/passwd", "ftp://host/x.png", " https://cdn/x.png"])
+def test_non_http_urls_are_rejected(store, url):
+    assert ADAPTERS["image"].parse([json.dumps({"url": url}).encode()], store) is None
+
+
+def test_falls_back_to_next_path_after_rejected_url(store):
+    body = json.dumps({"image_url": "javascript:alert(1)", "url": "HTTPS://cdn/x.png"}).encode()
+    assert ADAPTERS["image"].parse([body], store).url == "HTTPS://cdn/x.png"
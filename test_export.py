@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base, User, Transaction
+from backend.export import iter_export, iter_rows
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def add_transactions(db, timestamps):
+    db.add_all(Transaction(user_id=1, amount=0, credits=1.0, type="usage", description="x", timestamp=t) for t in timestamps)
+    db.commit()
+
+
+def test_keyset_paging_returns_every_row_once(db):
+    add_transactions(db, range(25))
+    rows = list(iter_rows(db, "transactions", batch_size=7))
+    assert [row[0] for row in rows] == list(range(1, 26))
+
+
+def test_time_filter_is_start_inclusive_end_exclusive(db):
+    add_transactions(db, range(10))
+    rows = list(iter_rows(db, "transactions", start=3, end=7, batch_size=2))
+    assert [row.timestamp for row in rows] == [3, 4, 5, 6]
+
+
+def test_resume_after_id(db):
+    add_transactions(db, range(10))
+    rows = list(iter_rows(db, "transactions", after_id=6, batch_size=3))
+    assert [row[0] for row in rows] == [7, 8, 9, 10]
+
+
+def test_csv_yields_one_chunk_per_batch(db):
+    add_transactions(db, range(5))
+    chunks = list(iter_export(db, "transactions", "csv", batch_size=2))
+    assert len(chunks) == 3
+    lines = list(csv.reader(io.StringIO("".join(chunks))))
+    assert lines[0] == ["id", "user_id", "amount", "credits", "type", "description", "timestamp"]
+    assert [line[0] for line in lines[1:]] == ["1", "2", "3", "4", "5"]
+
+
+def test_csv_resume_without_header(db):
+    add_transactions(db, range(5))
+    text = "".join(iter_export(db, "transactions", "csv", header=False, after_id=3))
+    assert [line[0] for line in csv.reader(io.StringIO(text))] == ["4", "5"]
+
+
+def test_ndjson_rows(db):
+    db.add(User(username="张三", hashed_password="x", balance=1.5, is_active=True))
+    db.commit()
+    lines = "".join(iter_export(db, "users", "ndjson")).splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"id": 1, "username": "张三", "email": None, "balance": 1.5, "is_active": True}
+    ]
+
+
+def test_empty_export_is_header_only(db):
+    assert "".join(iter_export(db, "transactions", "csv")) == "id,user_id,amount,credits,type,description,timestamp\r\n"
+    assert list(iter_export(db, "transactions", "ndjson")) == []
+
+
+def test_unknown_format_is_rejected(db):
+    with pytest.raises(ValueError):
+        list(iter_export(db, "users", "xml"))
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# 表由下面的临时数据库创建，导入 main 时不在默认数据库上建表
+os.environ.setdefault("DB_SCHEMA_READY", "true")
+
+from backend.database import Base, User, Generation
+from backend.main import app, get_current_user, get_db, parse_gallery_cursor
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def user(db):
+    user = User(username="alice", hashed_password="x", balance=0.0)
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def client(db, user):
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def add_generations(db, user_id, timestamps):
+    generations = [Generation(user_id=user_id, kind="image", prompt="p", result_url="https://cdn/x.png",
+                              cost=1.0, created_at=t) for t in timestamps]
+    db.add_all(generations)
+    db.commit()
+    return [g.id for g in generations]
+
+
+def fetch_all(client, limit):
+    ids, cursor = [], None
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/api/generations", params=params).json()
+        assert len(body["items"]) <= limit
+        ids.extend(item["id"] for item in body["items"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_parse_gallery_cursor_round_trips():
+    assert parse_gallery_cursor("1700000000.123456_42") == (1700000000.123456, 42)
+
+
+@pytest.mark.parametrize("cursor", ["abc", "1_2_3", "1.5_x", "x_1", "_"])
+def test_parse_gallery_cursor_rejects_invalid(cursor):
+    with pytest.raises(HTTPException) as excinfo:
+        parse_gallery_cursor(cursor)
+    assert excinfo.value.status_code == 400
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 100])
+def test_pagination_is_newest_first_with_ties_on_created_at(client, db, user, limit):
+    # 同一时刻的多条记录按 id 倒序，翻页时既不重复也不遗漏
+    ids = add_generations(db, user.id, [1700000000.5] * 5 + [1700000001.25, 1699999999.0])
+    expected = [ids[5]] + sorted(ids[:5], reverse=True) + [ids[6]]
+    assert fetch_all(client, limit) == expected
+
+
+def test_only_current_users_generations_are_listed(client, db, user):
+    other = User(username="bob", hashed_password="x", balance=0.0)
+    db.add(other)
+    db.commit()
+    add_generations(db, other.id, [1.0, 2.0])
+    mine = add_generations(db, user.id, [3.0])
+    assert fetch_all(client, 10) == mine
+
+
+def test_invalid_cursor_returns_400(client):
+    response = client.get("/api/generations", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
@@ -0,0 +1,58 @@
+import pytest
+
+from backend.prompt_pipeline import PromptRejected, build_default_pipeline
+
+
+def test_blocklist_matches_fullwidth_prompt():
+    pipeline = build_default_pipeline(blocklist=["bad"])
+    with pytest.raises(PromptRejected):
+        pipeline.run("a ＢＡＤ thing")
+
+
+@pytest.mark.parametrize("value", ["ＢＡＤ", "b\u200bad", "B\ufeffAD"])
+def test_blocklist_cannot_be_bypassed_through_variables(value):
+    pipeline = build_default_pipeline(blocklist=["bad"])
+    with pytest.raises(PromptRejected):
+        pipeline.run("a [X] thing", {"X": value})
+
+
+def test_whitespace_variable_is_collapsed():
+    pipeline = build_default_pipeline()
+    assert pipeline.run("a [X] thing", {"X": "   "}) == "a thing"
+    assert pipeline.run("[X]", {"X": "  cat \t "}) == "cat"
+
+
+def test_whitespace_only_variable_still_counts_as_empty():
+    pipeline = build_default_pipeline()
+    with pytest.raises(PromptRejected):
+        pipeline.run("[X]", {"X": " \u200b "})
+
+
+def test_missing_placeholder_is_rejected():
+    pipeline = build_default_pipeline()
+    with pytest.raises(PromptRejected):
+        pipeline.run("A [SUBJECT] logo in [STYLE]", {"STYLE": "pixel art"})
+
+
+def test_bracket_tokens_in_free_form_prompt_are_kept():
+    pipeline = build_default_pipeline()
+    assert pipeline.run("photo [HDR] style") == "photo [HDR] style"
+    assert pipeline.run("photo [HDR] style", {}) == "photo [HDR] style"
+
+
+@pytest.mark.parametrize("text", ["KILL him", "kill him", "Kill him"])
+def test_uppercase_pattern_matches_any_case(text):
+    pipeline = build_default_pipeline(patterns=[r"\bKILL\b"])
+    with pytest.raises(PromptRejected):
+        pipeline.run(text)
+    assert pipeline.run("skills") == "skills"
+
+
+def test_pattern_mask_keeps_original_case():
+    pipeline = build_default_pipeline(blocklist=["bad"], patterns=[r"secret\s*key"], blocklist_mode="mask")
+    assert pipeline.run("my SECRET KEY is Bad") == "my ********** is ***"
+
+
+def test_invalid_pattern_is_reported():
+    with pytest.raises(ValueError, match="Invalid blocklist pattern"):
+        build_default_pipeline(patterns=["(unclosed"])
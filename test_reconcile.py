@@ -0,0 +1,107 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base, User, Transaction, ensure_indexes
+from backend.reconcile import BaselineMissing, backfill_opening_balances, check_batch, reconcile, repair
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+
+
+@pytest.fixture
+def db(engine):
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def add_user(db, balance, ledger=()):
+    user = User(username=f"user{time.time_ns()}", hashed_password="x", balance=balance)
+    db.add(user)
+    db.flush()
+    for credits in ledger:
+        db.add(Transaction(user_id=user.id, amount=0, credits=credits, type="usage", timestamp=0))
+    db.commit()
+    return user
+
+
+def test_repair_requires_opening_balance_backfill(db):
+    legacy = add_user(db, 10.0)
+    with pytest.raises(BaselineMissing):
+        reconcile(db, full=True, fix=True, lag=0)
+
+    assert backfill_opening_balances(db) == 1
+    report = reconcile(db, full=True, fix=True, lag=0)
+    assert report["discrepancies"] == []
+    db.refresh(legacy)
+    assert legacy.balance == 10.0
+
+
+def test_repair_skips_users_charged_after_check(db):
+    backfill_opening_balances(db)
+    user = add_user(db, 100.0, ledger=[50.0])
+    found = check_batch(db, [user.id])
+    assert found[0]["ledger_balance"] == 50.0
+
+    # 对账读取之后、修复之前发生一笔扣费
+    user.balance -= 10
+    db.add(Transaction(user_id=user.id, amount=0, credits=-10, type="usage", timestamp=0))
+    db.commit()
+
+    assert repair(db, found) == 0
+    db.refresh(user)
+    assert user.balance == 90.0
+
+
+def test_repair_sets_balance_to_ledger_total(db):
+    backfill_opening_balances(db)
+    user = add_user(db, 100.0, ledger=[50.0, -5.0])
+    report = reconcile(db, full=True, fix=True, lag=0)
+    assert report["repaired"] == 1
+    db.refresh(user)
+    assert user.balance == 45.0
+
+
+def test_incremental_only_checks_users_with_new_transactions(db):
+    backfill_opening_balances(db)
+    reconcile(db, lag=0)
+    add_user(db, 5.0)
+    dirty = add_user(db, 7.0, ledger=[3.0])
+    report = reconcile(db, lag=0)
+    assert report["users_checked"] == 1
+    assert [item["user_id"] for item in report["discrepancies"]] == [dirty.id]
+
+
+def test_checkpoint_lags_behind_recent_transactions(db):
+    backfill_opening_balances(db)
+    user = add_user(db, 0.0)
+    db.add(Transaction(user_id=user.id, amount=0, credits=1, type="usage", timestamp=time.time()))
+    db.commit()
+    report = reconcile(db, lag=300)
+    assert report["checkpoint"] == 0
+    assert report["users_checked"] == 0
+
+
+def test_report_limit_caps_listed_discrepancies(db):
+    users = [add_user(db, 1.0) for _ in range(5)]
+    report = reconcile(db, full=True, lag=0, report_limit=2)
+    assert report["discrepancy_count"] == len(users)
+    assert len(report["discrepancies"]) == 2
+
+
+def test_ensure_indexes_adds_missing_indexes_to_existing_tables(engine):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_transactions_user_id"))
+        conn.execute(text("DROP INDEX ix_transactions_timestamp"))
+
+    assert sorted(ensure_indexes(engine)) == ["ix_transactions_timestamp", "ix_transactions_user_id"]
+    names = {index["name"] for index in inspect(engine).get_indexes("transactions")}
+    assert {"ix_transactions_timestamp", "ix_transactions_user_id"} <= names
+    assert ensure_indexes(engine) == []